@@ -2,7 +2,12 @@ import click
 
 from pymobiledevice3.cli.cli_common import Command
 from pymobiledevice3.lockdown import LockdownClient
-from pymobiledevice3.services.afc import AfcService, AfcShell
+from pymobiledevice3.services.afc import AfcService, AfcShell, MAXIMUM_READ_SIZE, MAXIMUM_WRITE_SIZE
+
+
+def chunk_size_option(default):
+    return click.option('--chunk-size', type=click.IntRange(min=1), default=default, show_default=True,
+                        help='Maximum payload size of each AFC read/write request.')
 
 
 @click.group()
@@ -26,25 +31,29 @@ def afc_shell(lockdown: LockdownClient):
 @afc.command('pull', cls=Command)
 @click.argument('remote_file', type=click.Path(exists=False))
 @click.argument('local_file', type=click.File('wb'))
-def afc_pull(lockdown: LockdownClient, remote_file, local_file):
+@chunk_size_option(MAXIMUM_READ_SIZE)
+def afc_pull(lockdown: LockdownClient, remote_file, local_file, chunk_size):
     """ pull remote file from /var/mobile/Media """
-    local_file.write(AfcService(lockdown=lockdown).get_file_contents(remote_file))
+    for chunk in AfcService(lockdown=lockdown).get_file_contents_iter(remote_file, chunk_size=chunk_size):
+        local_file.write(chunk)
 
 
 @afc.command('pull-dir', cls=Command)
 @click.argument('remote_dir', type=click.Path(exists=False))
 @click.argument('local_dir', type=click.Path(exists=False))
-def afc_pull_dir(lockdown: LockdownClient, remote_dir, local_dir: click.Path):
+@click.option('-j', '--jobs', type=click.INT, default=8, help='Number of files to download concurrently.')
+def afc_pull_dir(lockdown: LockdownClient, remote_dir, local_dir: click.Path, jobs):
     """ pull remote directory from /var/mobile/Media """
-    AfcService(lockdown=lockdown).pull(remote_dir, local_dir, )
+    AfcService(lockdown=lockdown).pull(remote_dir, local_dir, jobs=jobs)
 
 
 @afc.command('push', cls=Command)
 @click.argument('local_file', type=click.File('rb'))
 @click.argument('remote_file', type=click.Path(exists=False))
-def afc_push(lockdown: LockdownClient, local_file, remote_file):
+@chunk_size_option(MAXIMUM_WRITE_SIZE)
+def afc_push(lockdown: LockdownClient, local_file, remote_file, chunk_size):
     """ push local file into /var/mobile/Media """
-    AfcService(lockdown=lockdown).set_file_contents(remote_file, local_file.read())
+    AfcService(lockdown=lockdown).set_file_contents_from_file(remote_file, local_file, chunk_size=chunk_size)
 
 
 @afc.command('ls', cls=Command)
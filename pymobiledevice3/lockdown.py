@@ -346,6 +346,8 @@ class LockdownClient(object):
         service_connection = ServiceConnection.create(self.udid, attr['Port'])
         if attr.get('EnableServiceSSL', False):
             await service_connection.aio_ssl_start(self.ssl_file, self.ssl_file)
+        else:
+            await service_connection.aio_start()
         return service_connection
 
     def start_developer_service(self, name, escrow_bag=None) -> ServiceConnection:
@@ -358,5 +360,15 @@ class LockdownClient(object):
             )
             raise
 
+    async def aio_start_developer_service(self, name, escrow_bag=None) -> ServiceConnection:
+        try:
+            return await self.aio_start_service(name, escrow_bag)
+        except (StartServiceError, ConnectionFailedError):
+            self.logger.error(
+                'Failed to connect to required service. Make sure DeveloperDiskImage.dmg has been mounted. '
+                'You can do so using: pymobiledevice3 mounter mount'
+            )
+            raise
+
     def close(self):
         self.service.close()
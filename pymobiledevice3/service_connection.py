@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import plistlib
+import socket
 import ssl
 import struct
 import time
@@ -12,6 +13,9 @@ from pymobiledevice3 import usbmux
 from pymobiledevice3.exceptions import ConnectionFailedError, PyMobileDevice3Exception, ConnectionTerminatedError
 from pymobiledevice3.usbmux import select_device
 
+# large enough for bulk transfers not to be limited by the kernel's default socket buffers
+SOCKET_BUFFER_SIZE = 1 << 20
+
 SHELL_USAGE = """
 # This shell allows you to communicate directly with every service layer behind the lockdownd daemon.
 
@@ -73,6 +77,14 @@ class ServiceConnection(object):
     def setblocking(self, blocking: bool):
         self.socket.setblocking(blocking)
 
+    def set_buffer_sizes(self, size: int):
+        """ enlarge the kernel send/receive buffers, so bulk transfers aren't capped by the default window """
+        for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+            try:
+                self.socket.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError as e:
+                self.logger.debug(f'failed to set socket buffer size: {e}')
+
     def close(self):
         self.socket.close()
 
@@ -84,6 +96,15 @@ class ServiceConnection(object):
         self._writer = None
         self._reader = None
 
+    async def aio_start(self):
+        """ wrap the established plain socket with asyncio streams """
+        if isinstance(self.socket, ssl.SSLSocket):
+            if self.socket._sslobj is not None:
+                raise PyMobileDevice3Exception('cannot hand over an active SSL session to asyncio')
+            # asyncio refuses SSLSocket objects, even after their SSL context has been dropped
+            self.socket = socket.socket(fileno=self.socket.detach())
+        self._reader, self._writer = await asyncio.open_connection(sock=self.socket)
+
     def recv(self, length=4096):
         """ socket.recv() normal behavior. attempt to receive a single chunk """
         return self.socket.recv(length)
@@ -94,6 +115,35 @@ class ServiceConnection(object):
         except ssl.SSLEOFError as e:
             raise ConnectionTerminatedError from e
 
+    def sendall_buffers(self, buffers):
+        """ send all given buffers in order, using scatter/gather I/O instead of joining them when possible """
+        if isinstance(self.socket, ssl.SSLSocket) or not hasattr(self.socket, 'sendmsg'):
+            return self.sendall(b''.join(buffers))
+
+        buffers = [memoryview(buffer) for buffer in buffers if len(buffer)]
+        while buffers:
+            sent = self.socket.sendmsg(buffers)
+            # drop whatever was fully sent and retry with the remainder
+            while buffers and sent >= len(buffers[0]):
+                sent -= len(buffers[0])
+                buffers.pop(0)
+            if sent:
+                buffers[0] = buffers[0][sent:]
+
+    async def aio_sendall_buffers(self, buffers):
+        self._writer.writelines(buffers)
+        await self._writer.drain()
+
+    def sendfile(self, file, offset=0, count=None):
+        """
+        socket.sendfile() normal behavior. falls back to plain send() on SSL sockets or unsupported platforms.
+        returns the number of bytes sent, which is less than `count` if the file ended first.
+        """
+        try:
+            return self.socket.sendfile(file, offset, count)
+        except ssl.SSLEOFError as e:
+            raise ConnectionTerminatedError from e
+
     def send_recv_plist(self, data, endianity='>', fmt=plistlib.FMT_XML):
         self.send_plist(data, endianity=endianity, fmt=fmt)
         return self.recv_plist(endianity=endianity)
@@ -107,6 +157,18 @@ class ServiceConnection(object):
             data += chunk
         return data
 
+    def recvall_into(self, buffer):
+        """ fill the given writable buffer completely, receiving directly into it """
+        view = memoryview(buffer)
+        while len(view):
+            received = self.socket.recv_into(view)
+            if not received:
+                raise ConnectionAbortedError()
+            view = view[received:]
+
+    async def aio_recvall(self, size):
+        return await self._reader.readexactly(size)
+
     def recv_prefixed(self, endianity='>'):
         """ receive a data block prefixed with a u32 length field """
         size = self.recvall(4)
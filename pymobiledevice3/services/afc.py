@@ -1,16 +1,20 @@
 #!/usr/bin/env python3
 
+import io
 import logging
 import os
 import pathlib
 import posixpath
+import queue
 import shlex
 import struct
 import sys
 import tempfile
 import stat as stat_module
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from functools import partial
 
 import hexdump
 from click.exceptions import Exit
@@ -22,6 +26,7 @@ from pygnuutils.cli.ls import ls as ls_cli
 
 from pymobiledevice3.exceptions import AfcException, AfcFileNotFoundError, ArgumentError
 from pymobiledevice3.lockdown import LockdownClient
+from pymobiledevice3.service_connection import SOCKET_BUFFER_SIZE
 from pymobiledevice3.services.base_service import BaseService
 from pymobiledevice3.utils import try_decode
 
@@ -206,11 +211,25 @@ def list_to_dict(d):
 class AfcService(BaseService):
     def __init__(self, lockdown: LockdownClient, service_name='com.apple.afc'):
         super().__init__(lockdown, service_name)
+        self.service.set_buffer_sizes(SOCKET_BUFFER_SIZE)
         self.packet_num = 0
 
     skip_count = 0
 
-    def pull(self, relative_src, dst, callback=None, src_dir=''):
+    def pull(self, relative_src, dst, callback=None, src_dir='', jobs=1):
+        """
+        pull a remote file or directory
+        :param jobs: number of files to download concurrently, each over its own AFC connection
+        """
+        if jobs <= 1:
+            self._pull_internal(relative_src, dst, callback=callback, src_dir=src_dir)
+            return
+
+        pending_files = []
+        self._pull_internal(relative_src, dst, callback=callback, src_dir=src_dir, pending_files=pending_files)
+        self._pull_files(pending_files, jobs)
+
+    def _pull_internal(self, relative_src, dst, callback=None, src_dir='', pending_files=None):
         src = posixpath.join(src_dir, relative_src)
         if callback is not None:
             callback(src, dst)
@@ -232,8 +251,10 @@ class AfcService(BaseService):
             # check destination, skip existing.
             if not os.path.exists(dst):
                 print(f'{src} --> {dst}')
-                with open(dst, 'wb') as f:
-                    f.write(self.get_file_contents(src))
+                if pending_files is not None:
+                    pending_files.append((src, dst))
+                else:
+                    self._pull_file(src, dst)
             else:
                 print("skipping " + dst)
                 self.skip_count += 1
@@ -253,10 +274,43 @@ class AfcService(BaseService):
 
                 if self.isdir(src_filename):
                     dst_filename.mkdir(exist_ok=True)
-                    self.pull(src_filename, str(dst_path), callback=callback)
+                    self._pull_internal(src_filename, str(dst_path), callback=callback, pending_files=pending_files)
                     continue
 
-                self.pull(src_filename, str(dst_path), callback=callback)
+                self._pull_internal(src_filename, str(dst_path), callback=callback, pending_files=pending_files)
+
+    def _pull_file(self, src, dst):
+        with open(dst, 'wb') as f:
+            for chunk in self.get_file_contents_iter(src):
+                f.write(chunk)
+
+    def _create_transfer_connection(self):
+        """ open another connection to the same file system, overridden by subclasses that set up their connection """
+        return AfcService(self.lockdown, service_name=self.service_name)
+
+    def _pull_files(self, files, jobs):
+        """ download the given (src, dst) pairs over a pool of connections, as AFC serves one request at a time """
+        connections = queue.Queue()
+
+        def pull_file(src, dst):
+            afc = connections.get()
+            try:
+                afc._pull_file(src, dst)
+            finally:
+                connections.put(afc)
+
+        try:
+            for _ in range(min(jobs, len(files))):
+                connections.put(self._create_transfer_connection())
+
+            with ThreadPoolExecutor(max_workers=jobs) as executor:
+                futures = [executor.submit(pull_file, src, dst) for src, dst in files]
+            # the executor waits for every download, so a failure never leaves one running on a closed connection
+            for future in futures:
+                future.result()
+        finally:
+            while not connections.empty():
+                connections.get().close()
 
     def exists(self, filename):
         try:
@@ -286,7 +340,7 @@ class AfcService(BaseService):
                     raise
                 remote_path = posixpath.join(remote_parent, os.path.basename(remote_path))
             with open(local_path, 'rb') as f:
-                self.set_file_contents(remote_path, f.read())
+                self.set_file_contents_from_file(remote_path, f)
         else:
             # directory
             if not self.exists(remote_path):
@@ -402,11 +456,13 @@ class AfcService(BaseService):
                 raise
             raise AfcFileNotFoundError(e.args[0], e.status) from e
 
-    def fread(self, handle, sz):
-        data = b''
+    def fread_iter(self, handle, sz, chunk_size=MAXIMUM_READ_SIZE):
+        """ read `sz` bytes from given handle, yielding them in chunks of at most `chunk_size` bytes """
+        if chunk_size < 1:
+            raise ArgumentError(f'chunk_size must be positive, got: {chunk_size}')
         while sz > 0:
-            if sz > MAXIMUM_READ_SIZE:
-                to_read = MAXIMUM_READ_SIZE
+            if sz > chunk_size:
+                to_read = chunk_size
             else:
                 to_read = sz
             self._dispatch_packet(afc_opcode_t.READ, afc_fread_req_t.build({'handle': handle, 'size': to_read}))
@@ -414,8 +470,10 @@ class AfcService(BaseService):
             if status != afc_error_t.SUCCESS:
                 raise AfcException('fread error', status)
             sz -= to_read
-            data += chunk
-        return data
+            yield chunk
+
+    def fread(self, handle, sz):
+        return b''.join(self.fread_iter(handle, sz))
 
     def fwrite(self, handle, data, chunk_size=MAXIMUM_WRITE_SIZE):
         file_handle = struct.pack('<Q', handle)
@@ -444,6 +502,30 @@ class AfcService(BaseService):
             if status != afc_error_t.SUCCESS:
                 raise AfcException(f'failed to write last chunk: {status}', status)
 
+    def fwrite_from_file(self, handle, file, size, chunk_size=MAXIMUM_WRITE_SIZE):
+        """
+        write `size` bytes starting at the current position of a local binary file into given handle.
+        the payload of each chunk is handed to the kernel using sendfile() instead of being read into memory.
+        """
+        if chunk_size < 1:
+            raise ArgumentError(f'chunk_size must be positive, got: {chunk_size}')
+        file_handle = struct.pack('<Q', handle)
+        offset = file.tell()
+        end = offset + size
+        while offset < end:
+            to_write = min(chunk_size, end - offset)
+            header = self._build_packet_header(afc_opcode_t.WRITE, len(file_handle) + to_write, this_length=48)
+            self.service.sendall(header + file_handle)
+            sent = self.service.sendfile(file, offset, to_write)
+            if sent != to_write:
+                # the header already announced `to_write` bytes, so the stream can't be recovered
+                raise AfcException(f'local file ended after {sent} of {to_write} bytes', afc_error_t.IO_ERROR)
+            offset += to_write
+
+            status, response = self._receive_data()
+            if status != afc_error_t.SUCCESS:
+                raise AfcException(f'failed to write chunk: {status}', status)
+
     def resolve_path(self, filename: str):
         info = self.stat(filename)
         if info['st_ifmt'] == 'S_IFLNK':
@@ -455,7 +537,8 @@ class AfcService(BaseService):
                 filename = target
         return filename
 
-    def get_file_contents(self, filename):
+    def get_file_contents_iter(self, filename, chunk_size=MAXIMUM_READ_SIZE):
+        """ read remote file contents in chunks of at most `chunk_size` bytes without buffering the whole file """
         filename = self.resolve_path(filename)
         info = self.stat(filename)
 
@@ -465,9 +548,42 @@ class AfcService(BaseService):
         h = self.fopen(filename)
         if not h:
             return
-        d = self.fread(h, int(info['st_size']))
-        self.fclose(h)
-        return d
+        try:
+            yield from self.fread_iter(h, int(info['st_size']), chunk_size=chunk_size)
+        finally:
+            self.fclose(h)
+
+    def get_file_contents(self, filename):
+        return b''.join(self.get_file_contents_iter(filename))
+
+    def set_file_contents_iter(self, filename, chunks, chunk_size=MAXIMUM_WRITE_SIZE):
+        """ write each of the given data chunks into the remote file, one after the other """
+        h = self.fopen(filename, 'w')
+        try:
+            for chunk in chunks:
+                self.fwrite(h, chunk, chunk_size=chunk_size)
+        finally:
+            self.fclose(h)
+
+    def set_file_contents_from_file(self, filename, file, chunk_size=MAXIMUM_WRITE_SIZE):
+        """ write a local binary file object into the remote file, using sendfile() when it refers to a regular file """
+        if chunk_size < 1:
+            raise ArgumentError(f'chunk_size must be positive, got: {chunk_size}')
+        try:
+            st = os.fstat(file.fileno())
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            st = None
+
+        if st is None or not stat_module.S_ISREG(st.st_mode):
+            # pipes and in-memory files have no known size, so just stream their contents
+            self.set_file_contents_iter(filename, iter(partial(file.read, chunk_size), b''), chunk_size=chunk_size)
+            return
+
+        h = self.fopen(filename, 'w')
+        try:
+            self.fwrite_from_file(h, file, st.st_size - file.tell(), chunk_size=chunk_size)
+        finally:
+            self.fclose(h)
 
     def set_file_contents(self, filename, data):
         h = self.fopen(filename, 'w')
@@ -507,17 +623,19 @@ class AfcService(BaseService):
     def lock(self, handle, operation):
         return self._do_operation(afc_opcode_t.FILE_LOCK, afc_lock_t.build({'handle': handle, 'op': operation}))
 
-    def _dispatch_packet(self, operation, data, this_length=0):
+    def _build_packet_header(self, operation, data_length, this_length=0):
         afcpack = Container(magic=AFCMAGIC,
-                            entire_length=afc_header_t.sizeof() + len(data),
-                            this_length=afc_header_t.sizeof() + len(data),
+                            entire_length=afc_header_t.sizeof() + data_length,
+                            this_length=afc_header_t.sizeof() + data_length,
                             packet_num=self.packet_num,
                             operation=operation)
         if this_length:
             afcpack.this_length = this_length
-        header = afc_header_t.build(afcpack)
         self.packet_num += 1
-        self.service.sendall(header + data)
+        return afc_header_t.build(afcpack)
+
+    def _dispatch_packet(self, operation, data, this_length=0):
+        self.service.sendall(self._build_packet_header(operation, len(data), this_length=this_length) + data)
 
     def _receive_data(self):
         res = self.service.recvall(afc_header_t.sizeof())
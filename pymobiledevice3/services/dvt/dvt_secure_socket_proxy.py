@@ -1,6 +1,7 @@
 from packaging.version import Version
 
 from pymobiledevice3.lockdown import LockdownClient
+from pymobiledevice3.service_connection import ServiceConnection
 from pymobiledevice3.services.remote_server import RemoteServer
 
 
@@ -8,12 +9,18 @@ class DvtSecureSocketProxyService(RemoteServer):
     SERVICE_NAME = 'com.apple.instruments.remoteserver.DVTSecureSocketProxy'
     OLD_SERVICE_NAME = 'com.apple.instruments.remoteserver'
 
-    def __init__(self, lockdown: LockdownClient):
-        if Version(lockdown.ios_version) >= Version('14.0'):
-            service_name = self.SERVICE_NAME
-            remove_ssl_context = False
-        else:
-            service_name = self.OLD_SERVICE_NAME
-            remove_ssl_context = True
+    def __init__(self, lockdown: LockdownClient, service: ServiceConnection = None):
+        service_name, remove_ssl_context = self._get_service_parameters(lockdown)
+        super().__init__(lockdown, service_name, remove_ssl_context=remove_ssl_context, service=service)
+
+    @classmethod
+    async def aio_create(cls, lockdown: LockdownClient):
+        """ create an instance driven by asyncio, to be used as an async context manager """
+        service_name, remove_ssl_context = cls._get_service_parameters(lockdown)
+        return cls(lockdown, service=await cls.aio_start_service(lockdown, service_name, remove_ssl_context))
 
-        super().__init__(lockdown, service_name, remove_ssl_context=remove_ssl_context)
+    @classmethod
+    def _get_service_parameters(cls, lockdown: LockdownClient):
+        if Version(lockdown.ios_version) >= Version('14.0'):
+            return cls.SERVICE_NAME, False
+        return cls.OLD_SERVICE_NAME, True
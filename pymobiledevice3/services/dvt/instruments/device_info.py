@@ -1,16 +1,21 @@
+import asyncio
 import plistlib
 import typing
 from datetime import datetime
 
 from pymobiledevice3.exceptions import DvtDirListError
-from pymobiledevice3.services.remote_server import MessageAux
+from pymobiledevice3.services.remote_server import MessageAux, Channel
 
 
 class DeviceInfo:
     IDENTIFIER = 'com.apple.instruments.server.services.deviceinfo'
 
-    def __init__(self, dvt):
-        self._channel = dvt.make_channel(self.IDENTIFIER)
+    def __init__(self, dvt, channel: Channel = None):
+        self._channel = dvt.make_channel(self.IDENTIFIER) if channel is None else channel
+
+    @classmethod
+    async def aio_create(cls, dvt):
+        return cls(dvt, channel=await dvt.aio_make_channel(cls.IDENTIFIER))
 
     def ls(self, path: str) -> list:
         """
@@ -32,6 +37,14 @@ class DeviceInfo:
         self._channel.execnameForPid_(MessageAux().append_obj(pid))
         return self._channel.receive_plist()
 
+    async def aio_execname_for_pids(self, pids: typing.Iterable[int]) -> typing.List[str]:
+        """
+        get full path for each of the given pids, sending all requests before waiting for the replies
+        :param pids: process pids
+        """
+        return await asyncio.gather(*(self._channel.aio_request('execnameForPid:', MessageAux().append_obj(pid))
+                                      for pid in pids))
+
     def proclist(self) -> list:
         """
         Get the process list from the device.
@@ -40,9 +53,11 @@ class DeviceInfo:
         self._channel.runningProcesses()
         result = self._channel.receive_plist()
         assert isinstance(result, list)
+        from_timestamp = datetime.fromtimestamp
         for process in result:
-            if 'startDate' in process:
-                process['startDate'] = datetime.fromtimestamp(process['startDate'])
+            start_date = process.get('startDate')
+            if start_date is not None:
+                process['startDate'] = from_timestamp(start_date)
         return result
 
     def system_information(self):
@@ -1,13 +1,20 @@
 import dataclasses
 import ipaddress
 import logging
+from functools import lru_cache
 
 from construct import Struct, Int32ul, this, Adapter, Switch, Int8ul, Int16ub, Bytes
 
 
+@lru_cache(maxsize=1024)
+def ip_address(packed: bytes):
+    # connection events mostly refer to the same few peers, and address objects are immutable
+    return ipaddress.ip_address(packed)
+
+
 class IpAddressAdapter(Adapter):
     def _decode(self, obj, context, path):
-        return ipaddress.ip_address(obj)
+        return ip_address(obj)
 
 
 address_t = Struct(
@@ -26,7 +33,7 @@ address_t = Struct(
         )
     })
 
-)
+).compile()
 
 MESSAGE_TYPE_INTERFACE_DETECTION = 0
 MESSAGE_TYPE_CONNECTION_DETECTION = 1
@@ -78,7 +85,7 @@ class NetworkMonitor:
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        self._channel.stopMonitoring()
+        self._channel.stopMonitoring(expects_reply=False)
 
     def __iter__(self):
         while True:
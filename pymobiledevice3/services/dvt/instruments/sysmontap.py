@@ -1,17 +1,25 @@
 import dataclasses
+import logging
+import os
+import plistlib
+import tempfile
 
+from pymobiledevice3.lockdown import HOMEFOLDER
 from pymobiledevice3.services.dvt.instruments.device_info import DeviceInfo
 from pymobiledevice3.services.remote_server import Tap
 
+# the available attributes only change between iOS builds, so they are cached per device and build
+ATTRIBUTES_CACHE_FOLDER = HOMEFOLDER / 'sysmontap'
+
 
 class Sysmontap(Tap):
     IDENTIFIER = 'com.apple.instruments.server.services.sysmontap'
 
     def __init__(self, dvt):
+        self.logger = logging.getLogger(__name__)
         self._device_info = DeviceInfo(dvt)
 
-        process_attributes = list(self._device_info.request_information('sysmonProcessAttributes'))
-        system_attributes = list(self._device_info.request_information('sysmonSystemAttributes'))
+        process_attributes, system_attributes = self._get_attributes(dvt.lockdown)
 
         self.process_attributes_cls = dataclasses.make_dataclass('SysmonProcessAttributes', process_attributes)
         self.system_attributes_cls = dataclasses.make_dataclass('SysmonSystemAttributes', system_attributes)
@@ -27,10 +35,42 @@ class Sysmontap(Tap):
 
         super().__init__(dvt, self.IDENTIFIER, config)
 
-    def __iter__(self):
-        while True:
-            for result in self._channel.receive_plist():
-                yield result
+    def _get_attributes(self, lockdown):
+        build_version = lockdown.all_values.get('BuildVersion')
+        if build_version is None:
+            # without a build version there is nothing to invalidate the cache with
+            return self._request_attributes()
+
+        cache_file = ATTRIBUTES_CACHE_FOLDER / f'{lockdown.identifier}_{build_version}.plist'
+        try:
+            cached = plistlib.loads(cache_file.read_bytes())
+            return cached['ProcessAttributes'], cached['SystemAttributes']
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # a corrupt cache is simply rebuilt
+            self.logger.debug(f'ignoring invalid sysmontap attributes cache {cache_file}: {e}')
+
+        process_attributes, system_attributes = self._request_attributes()
+
+        temp_file = None
+        try:
+            ATTRIBUTES_CACHE_FOLDER.mkdir(parents=True, exist_ok=True)
+            # write into a temporary file first, so an interrupted write never leaves a truncated cache behind
+            with tempfile.NamedTemporaryFile(dir=ATTRIBUTES_CACHE_FOLDER, suffix='.tmp', delete=False) as f:
+                temp_file = f.name
+                f.write(plistlib.dumps({'ProcessAttributes': process_attributes,
+                                        'SystemAttributes': system_attributes}))
+            os.replace(temp_file, cache_file)
+        except OSError as e:
+            self.logger.debug(f'failed to cache sysmontap attributes: {e}')
+            if temp_file is not None and os.path.exists(temp_file):
+                os.unlink(temp_file)
+        return process_attributes, system_attributes
+
+    def _request_attributes(self):
+        return (list(self._device_info.request_information('sysmonProcessAttributes')),
+                list(self._device_info.request_information('sysmonSystemAttributes')))
 
     def iter_processes(self):
         for row in self:
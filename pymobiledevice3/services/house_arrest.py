@@ -1,7 +1,8 @@
 import logging
 
 from pymobiledevice3.lockdown import LockdownClient
-from pymobiledevice3.services.afc import AfcService, AfcShell
+from pymobiledevice3.exceptions import AfcException
+from pymobiledevice3.services.afc import AfcService, AfcShell, afc_error_t
 
 
 class HouseArrestService(AfcService):
@@ -12,6 +13,7 @@ class HouseArrestService(AfcService):
         self.lockdown = lockdown
         service_name = self.SERVICE_NAME
         super(HouseArrestService, self).__init__(self.lockdown, service_name)
+        self._vended = None
 
     def send_command(self, bundle_id, cmd='VendContainer'):
         self.service.send_plist({'Command': cmd, 'Identifier': bundle_id})
@@ -20,8 +22,16 @@ class HouseArrestService(AfcService):
             self.logger.error('%s: %s', bundle_id, res.get('Error'))
             return False
         else:
+            self._vended = (bundle_id, cmd)
             return True
 
+    def _create_transfer_connection(self):
+        connection = HouseArrestService(self.lockdown)
+        if self._vended is not None and not connection.send_command(*self._vended):
+            connection.close()
+            raise AfcException(f'failed to vend {self._vended[0]} over another connection', afc_error_t.UNKNOWN_ERROR)
+        return connection
+
     def shell(self, application_id, cmd='VendContainer'):
         res = self.send_command(application_id, cmd)
         if res:
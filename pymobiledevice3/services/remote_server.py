@@ -1,18 +1,21 @@
-import io
+import asyncio
 import plistlib
+import struct
 import typing
-from functools import partial
+from collections import namedtuple
+from functools import partial, lru_cache
 from pprint import pprint
 from queue import Queue, Empty
 
 import IPython
 from bpylist2 import archiver
 from construct import Struct, Default, Int64ul, Prefixed, GreedyRange, Select, Const, Int32ul, Switch, this, \
-    GreedyBytes, Adapter, Int16ul, Int32sl
+    GreedyBytes, Adapter
 from pygments import highlight, lexers, formatters
 
-from pymobiledevice3.exceptions import DvtException
+from pymobiledevice3.exceptions import DvtException, ConnectionTerminatedError
 from pymobiledevice3.lockdown import LockdownClient
+from pymobiledevice3.service_connection import ServiceConnection, SOCKET_BUFFER_SIZE
 from pymobiledevice3.services.base_service import BaseService
 
 SHELL_USAGE = '''
@@ -63,42 +66,60 @@ message_aux_t_struct = Struct(
                          default=GreedyBytes),
     )))
 )
-dtx_message_header_struct = Struct(
-    'magic' / Const(0x1F3D5B79, Int32ul),
-    'cb' / Int32ul,
-    'fragmentId' / Int16ul,
-    'fragmentCount' / Int16ul,
-    'length' / Int32ul,
-    'identifier' / Int32ul,
-    'conversationIndex' / Int32ul,
-    'channelCode' / Int32sl,
-    'expectsReply' / Int32ul,
-)
-dtx_message_payload_header_struct = Struct(
-    'flags' / Int32ul,
-    'auxiliaryLength' / Int32ul,
-    'totalLength' / Int64ul,
-)
+DTX_MESSAGE_MAGIC = 0x1F3D5B79
+
+# fixed-size headers of every DTX message, built and parsed with plain struct as they are on the hot path.
+# their fields are named by the matching namedtuples below
+DTX_MESSAGE_HEADER = struct.Struct('<IIHHIIIiI')
+DTX_MESSAGE_PAYLOAD_HEADER = struct.Struct('<IIQ')
+DtxMessageHeader = namedtuple('DtxMessageHeader', [
+    'magic', 'cb', 'fragmentId', 'fragmentCount', 'length', 'identifier', 'conversationIndex', 'channelCode',
+    'expectsReply'])
+DtxMessagePayloadHeader = namedtuple('DtxMessagePayloadHeader', ['flags', 'auxiliaryLength', 'totalLength'])
+
+
+def parse_message_header(data: bytes) -> DtxMessageHeader:
+    mheader = DtxMessageHeader._make(DTX_MESSAGE_HEADER.unpack(data))
+    if mheader.magic != DTX_MESSAGE_MAGIC:
+        raise DvtException(f'invalid DTX message magic: {mheader.magic:#x}')
+    return mheader
+
+
+@lru_cache(maxsize=256)
+def archive_selector(selector: str) -> bytes:
+    """ selectors are resent over and over, so only archive each one once """
+    return archiver.archive(selector)
 
 
 class MessageAux:
+    """
+    Auxiliary (parameters) of a message.
+    Serialization is cached until another value is appended, so resending the same object doesn't re-archive it.
+    Appended objects must therefore not be mutated afterwards.
+    """
+
     def __init__(self):
         self.values = []
+        self._serialized = None
 
     def append_int(self, value: int):
-        self.values.append({'type': 3, 'value': value})
-        return self
+        return self._append({'type': 3, 'value': value})
 
     def append_long(self, value: int):
-        self.values.append({'type': 6, 'value': value})
-        return self
+        return self._append({'type': 6, 'value': value})
 
     def append_obj(self, value):
-        self.values.append({'type': 2, 'value': value})
+        return self._append({'type': 2, 'value': value})
+
+    def _append(self, value):
+        self.values.append(value)
+        self._serialized = None
         return self
 
     def __bytes__(self):
-        return message_aux_t_struct.build(dict(aux=self.values))
+        if self._serialized is None:
+            self._serialized = message_aux_t_struct.build(dict(aux=self.values))
+        return self._serialized
 
 
 class DTTapMessage:
@@ -119,6 +140,9 @@ class NSError:
         raise DvtException(archive_obj.decode('NSUserInfo'))
 
 
+# class name embedded in the archived payload of the (otherwise meaningless) heartbeats sent by taps
+TAP_HEARTBEAT_MESSAGE_CLASS = b'DTTapHeartbeatMessage'
+
 archiver.update_class_map({'DTSysmonTapMessage': DTTapMessage,
                            'DTTapHeartbeatMessage': DTTapMessage,
                            'DTTapStatusMessage': DTTapMessage,
@@ -133,6 +157,7 @@ class Channel(int):
     def create(cls, value: int, service):
         channel = cls(value)
         channel._service = service
+        channel._selectors = {}
         return channel
 
     def receive_plist(self):
@@ -141,6 +166,18 @@ class Channel(int):
     def receive_message(self):
         return self._service.recv_message(self)[0]
 
+    async def aio_receive_plist(self):
+        return (await self._service.aio_recv_plist(self))[0]
+
+    async def aio_receive_message(self):
+        return (await self._service.aio_recv_message(self))[0]
+
+    async def aio_send_message(self, selector: str = None, args: MessageAux = None, expects_reply: bool = True):
+        await self._service.aio_send_message(self, selector, args, expects_reply=expects_reply)
+
+    async def aio_request(self, selector: str, args: MessageAux = None):
+        return (await self._service.aio_request(self, selector, args))[0]
+
     @staticmethod
     def _sanitize_name(name: str):
         """
@@ -153,34 +190,47 @@ class Channel(int):
         return name
 
     def __getitem__(self, item):
-        return partial(self._service.send_message, self, item)
+        selector = self._selectors.get(item)
+        if selector is None:
+            selector = partial(self._service.send_message, self, item)
+            self._selectors[item] = selector
+        return selector
 
     def __getattr__(self, item):
-        return self[self._sanitize_name(item)]
+        selector = self[self._sanitize_name(item)]
+        # store as an instance attribute so later lookups don't reach __getattr__ at all
+        setattr(self, item, selector)
+        return selector
 
 
 class ChannelFragmenter:
     def __init__(self):
         self._messages = Queue()
-        self._packet_data = b''
-        self._stream_packet_data = b''
+        # fragments are collected and joined once the last one arrives, avoiding quadratic concatenation
+        self._packet_data = []
+        self._stream_packet_data = []
 
     def get(self):
         return self._messages.get_nowait()
 
     def add_fragment(self, mheader, chunk):
         if mheader.channelCode >= 0:
-            self._packet_data += chunk
+            self._packet_data.append(chunk)
             if mheader.fragmentId == mheader.fragmentCount - 1:
                 # last message
-                self._messages.put(self._packet_data)
-                self._packet_data = b''
+                self._messages.put(self._join(self._packet_data))
+                self._packet_data = []
         else:
-            self._stream_packet_data += chunk
+            self._stream_packet_data.append(chunk)
             if mheader.fragmentId == mheader.fragmentCount - 1:
                 # last message
-                self._messages.put(self._stream_packet_data)
-                self._stream_packet_data = b''
+                self._messages.put(self._join(self._stream_packet_data))
+                self._stream_packet_data = []
+
+    @staticmethod
+    def _join(fragments):
+        # a message sent as a single fragment is kept as is, saving a copy
+        return fragments[0] if len(fragments) == 1 else b''.join(fragments)
 
 
 class RemoteServer(BaseService):
@@ -192,6 +242,13 @@ class RemoteServer(BaseService):
     If the value is true, then `/tmp/DTServiceHub[PID].DTXConnection.RANDOM.log` is created and can be used to debug the
     transport protocol.
 
+    Besides the blocking API, every send/receive method has an `aio_` counterpart. These require a service connection
+    created using `aio_start_service()` and the object to be used as an async context manager. A background task then
+    demultiplexes incoming messages into per-channel queues, so several channels can be consumed concurrently.
+    Replies to messages sent using `aio_request()` are matched by their identifier instead, so many requests can be
+    outstanding at once.
+    The two APIs must not be mixed on the same connection.
+
     For example:
 
     ```
@@ -231,19 +288,40 @@ class RemoteServer(BaseService):
     BROADCAST_CHANNEL = 0
     INSTRUMENTS_MESSAGE_TYPE = 2
     EXPECTS_REPLY_MASK = 0x1000
+    HANDSHAKE_SELECTOR = '_notifyOfPublishedCapabilities:'
 
-    def __init__(self, lockdown: LockdownClient, service_name, remove_ssl_context=True):
-        super().__init__(lockdown, service_name, is_developer_service=True)
+    def __init__(self, lockdown: LockdownClient, service_name, remove_ssl_context=True,
+                 service: ServiceConnection = None):
+        super().__init__(lockdown, service_name, is_developer_service=True, service=service)
 
         if remove_ssl_context and hasattr(self.service.socket, '_sslobj'):
             self.service.socket._sslobj = None
+        self.service.set_buffer_sizes(SOCKET_BUFFER_SIZE)
 
         self.supported_identifiers = {}
         self.last_channel_code = 0
         self.cur_message = 0
         self.channel_cache = {}
         self.channel_messages = {self.BROADCAST_CHANNEL: ChannelFragmenter()}
+        self._header_buffer = bytearray(DTX_MESSAGE_HEADER.size)
+        self.channel_queues = {}  # type: typing.MutableMapping[int, asyncio.Queue]
+        self.pending_replies = {}  # type: typing.MutableMapping[int, asyncio.Future]
         self.broadcast = Channel.create(0, self)
+        self._reader_task = None  # type: typing.Optional[asyncio.Task]
+        self._reader_exception = None  # type: typing.Optional[BaseException]
+
+    @staticmethod
+    async def aio_start_service(lockdown: LockdownClient, service_name, remove_ssl_context=True) -> ServiceConnection:
+        """ start a service connection driven by asyncio streams, to be passed as the `service` argument """
+        if not remove_ssl_context:
+            return await lockdown.aio_start_developer_service(service_name)
+
+        # SSL is only needed for the initial handshake, after which the plain socket is handed over to asyncio
+        service = await asyncio.get_event_loop().run_in_executor(None, lockdown.start_developer_service, service_name)
+        if hasattr(service.socket, '_sslobj'):
+            service.socket._sslobj = None
+        await service.aio_start()
+        return service
 
     def shell(self):
         IPython.embed(
@@ -255,12 +333,25 @@ class RemoteServer(BaseService):
             })
 
     def perform_handshake(self):
+        self.send_message(0, self.HANDSHAKE_SELECTOR, self._handshake_args(), expects_reply=False)
+        self._handle_handshake_reply(*self.recv_message())
+
+    async def aio_perform_handshake(self):
+        await self.aio_send_message(0, self.HANDSHAKE_SELECTOR, self._handshake_args(), expects_reply=False)
+        self._handle_handshake_reply(*await self.aio_recv_message())
+
+    @staticmethod
+    def _handshake_args() -> MessageAux:
         args = MessageAux()
         args.append_obj({'com.apple.private.DTXBlockCompression': 0, 'com.apple.private.DTXConnection': 1})
-        self.send_message(0, '_notifyOfPublishedCapabilities:', args, expects_reply=False)
-        ret, aux = self.recv_plist()
-        if ret != '_notifyOfPublishedCapabilities:':
-            raise ValueError('Invalid answer')
+        return args
+
+    def _handle_handshake_reply(self, data, aux):
+        # the device echoes the selector, which usually matches our own archived form and needs no unarchiving
+        if data != archive_selector(self.HANDSHAKE_SELECTOR):
+            ret, aux = self._unarchive_message(data, aux)
+            if ret != self.HANDSHAKE_SELECTOR:
+                raise ValueError('Invalid answer')
         if not len(aux[0]):
             raise ValueError('Invalid answer')
         self.supported_identifiers = aux[0].value
@@ -270,9 +361,7 @@ class RemoteServer(BaseService):
         if identifier in self.channel_cache:
             return self.channel_cache[identifier]
 
-        self.last_channel_code += 1
-        code = self.last_channel_code
-        args = MessageAux().append_int(code).append_obj(identifier)
+        code, args = self._next_channel_request(identifier)
         self.send_message(0, '_requestChannelWithCode:identifier:', args)
         ret, aux = self.recv_plist()
         assert ret is None
@@ -281,31 +370,91 @@ class RemoteServer(BaseService):
         self.channel_messages[code] = ChannelFragmenter()
         return channel
 
+    async def aio_make_channel(self, identifier) -> Channel:
+        assert identifier in self.supported_identifiers
+        if identifier in self.channel_cache:
+            return self.channel_cache[identifier]
+
+        code, args = self._next_channel_request(identifier)
+        await self.aio_send_message(0, '_requestChannelWithCode:identifier:', args)
+        ret, aux = await self.aio_recv_plist()
+        assert ret is None
+        channel = Channel.create(code, self)
+        self.channel_cache[identifier] = channel
+        return channel
+
+    def _next_channel_request(self, identifier):
+        self.last_channel_code += 1
+        code = self.last_channel_code
+        return code, MessageAux().append_int(code).append_obj(identifier)
+
     def send_message(self, channel: int, selector: str = None, args: MessageAux = None, expects_reply: bool = True):
+        self.service.sendall_buffers(self._build_message(channel, selector, args, expects_reply))
+
+    async def aio_send_message(self, channel: int, selector: str = None, args: MessageAux = None,
+                               expects_reply: bool = True):
+        await self.service.aio_sendall_buffers(self._build_message(channel, selector, args, expects_reply))
+
+    async def aio_request(self, channel: int, selector: str, args: MessageAux = None):
+        """ send a message and wait for its reply, without blocking other requests sent in the meantime """
+        if self._reader_exception is not None:
+            # no reader is left to ever resolve the reply
+            raise ConnectionTerminatedError() from self._reader_exception
+        message = self._build_message(channel, selector, args, expects_reply=True)
+        identifier = self.cur_message
+        # When deprecating python3.6, replace with get_running_loop.
+        reply = asyncio.get_event_loop().create_future()
+        self.pending_replies[identifier] = reply
+        try:
+            await self.service.aio_sendall_buffers(message)
+            return self._unarchive_message(*self._parse_message(await reply))
+        finally:
+            self.pending_replies.pop(identifier, None)
+
+    def send_prebuilt(self, channel: int, sel: bytes, aux: bytes = b'', expects_reply: bool = True):
+        """ send a message whose archived selector and serialized MessageAux were built once by the caller """
+        self.service.sendall_buffers(self._build_raw_message(channel, sel, aux, expects_reply))
+
+    def _build_message(self, channel: int, selector: str = None, args: MessageAux = None, expects_reply: bool = True):
+        aux = bytes(args) if args is not None else b''
+        sel = archive_selector(selector) if selector is not None else b''
+        return self._build_raw_message(channel, sel, aux, expects_reply)
+
+    def _build_raw_message(self, channel: int, sel: bytes, aux: bytes, expects_reply: bool):
         self.cur_message += 1
 
-        aux = bytes(args) if args is not None else b''
-        sel = archiver.archive(selector) if selector is not None else b''
         flags = self.INSTRUMENTS_MESSAGE_TYPE
         if expects_reply:
             flags |= self.EXPECTS_REPLY_MASK
-        pheader = dtx_message_payload_header_struct.build(dict(flags=flags, auxiliaryLength=len(aux),
-                                                               totalLength=len(aux) + len(sel)))
-        mheader = dtx_message_header_struct.build(dict(
-            cb=dtx_message_header_struct.sizeof(),
-            fragmentId=0,
-            fragmentCount=1,
-            length=dtx_message_payload_header_struct.sizeof() + len(aux) + len(sel),
-            identifier=self.cur_message,
-            conversationIndex=0,
-            channelCode=channel,
-            expectsReply=int(expects_reply)
-        ))
-        msg = mheader + pheader + aux + sel
-        self.service.sendall(msg)
-
-    def recv_plist(self, channel: int = BROADCAST_CHANNEL):
-        data, aux = self.recv_message(channel)
+        pheader = DTX_MESSAGE_PAYLOAD_HEADER.pack(flags, len(aux), len(aux) + len(sel))
+        mheader = DTX_MESSAGE_HEADER.pack(
+            DTX_MESSAGE_MAGIC,
+            DTX_MESSAGE_HEADER.size,  # cb
+            0,  # fragmentId
+            1,  # fragmentCount
+            DTX_MESSAGE_PAYLOAD_HEADER.size + len(aux) + len(sel),  # length
+            self.cur_message,  # identifier
+            0,  # conversationIndex
+            channel,  # channelCode
+            int(expects_reply),
+        )
+        return [mheader, pheader, aux, sel]
+
+    def recv_plist(self, channel: int = BROADCAST_CHANNEL, skip: bytes = None):
+        """
+        receive and unarchive the next message
+        :param skip: drop messages whose archived data contains these bytes (such as a class name) without
+                     unarchiving them
+        """
+        while True:
+            data, aux = self.recv_message(channel)
+            if skip is None or data is None or skip not in data:
+                return self._unarchive_message(data, aux)
+
+    async def aio_recv_plist(self, channel: int = BROADCAST_CHANNEL):
+        return self._unarchive_message(*await self.aio_recv_message(channel))
+
+    def _unarchive_message(self, data, aux):
         if data is not None:
             try:
                 data = archiver.unarchive(data)
@@ -317,32 +466,46 @@ class RemoteServer(BaseService):
         return data, aux
 
     def recv_message(self, channel: int = BROADCAST_CHANNEL):
-        packet_stream = self._recv_packet_fragments(channel)
-        pheader = dtx_message_payload_header_struct.parse_stream(packet_stream)
+        return self._parse_message(self._recv_packet_fragments(channel))
+
+    async def aio_recv_message(self, channel: int = BROADCAST_CHANNEL):
+        queue = self._get_channel_queue(channel)
+        message = await queue.get()
+        if message is None:
+            # wake up any other waiter as well
+            queue.put_nowait(None)
+            raise ConnectionTerminatedError() from self._reader_exception
+        return self._parse_message(message)
+
+    @staticmethod
+    def _parse_message(message):
+        message = memoryview(message)
+        pheader = DtxMessagePayloadHeader._make(DTX_MESSAGE_PAYLOAD_HEADER.unpack_from(message))
+
+        offset = DTX_MESSAGE_PAYLOAD_HEADER.size
 
         compression = (pheader.flags & 0xFF000) >> 12
         if compression:
             raise NotImplementedError('Compressed')
-
         if pheader.auxiliaryLength:
-            aux = message_aux_t_struct.parse_stream(packet_stream).aux
+            aux = message_aux_t_struct.parse(message[offset:offset + pheader.auxiliaryLength]).aux
         else:
             aux = None
+        offset += pheader.auxiliaryLength
         obj_size = pheader.totalLength - pheader.auxiliaryLength
-        data = packet_stream.read(obj_size) if obj_size else None
+        data = bytes(message[offset:offset + obj_size]) if obj_size else None
         return data, aux
 
     def _recv_packet_fragments(self, channel: int = BROADCAST_CHANNEL):
         while True:
             try:
                 # if we already have a message for this channel, just return it
-                message = self.channel_messages[channel].get()
-                return io.BytesIO(message)
+                return self.channel_messages[channel].get()
             except Empty:
                 # if no message exists for the given channel code, just keep waiting and receive new messages
                 # until the waited message queue has at least one message
-                data = self.service.recvall(dtx_message_header_struct.sizeof())
-                mheader = dtx_message_header_struct.parse(data)
+                self.service.recvall_into(self._header_buffer)
+                mheader = parse_message_header(self._header_buffer)
 
                 # treat both as the negative and positive representation of the channel code in the response
                 # the same when performing fragmentation
@@ -359,12 +522,92 @@ class RemoteServer(BaseService):
                     # when reading multiple message fragments, the first fragment contains only a message header
                     continue
 
-                self.channel_messages[received_channel_code].add_fragment(mheader, self.service.recvall(mheader.length))
+                chunk = bytearray(mheader.length)
+                self.service.recvall_into(chunk)
+                self.channel_messages[received_channel_code].add_fragment(mheader, chunk)
+
+    def _get_channel_queue(self, channel: int) -> asyncio.Queue:
+        queue = self.channel_queues.get(channel)
+        if queue is None:
+            queue = asyncio.Queue()
+            if self._reader_exception is not None:
+                queue.put_nowait(None)
+            self.channel_queues[channel] = queue
+        return queue
+
+    async def _reader_loop(self):
+        """ receive messages and dispatch them into the queue of their respective channel """
+        fragments = {}
+        try:
+            while True:
+                mheader = parse_message_header(await self.service.aio_recvall(DTX_MESSAGE_HEADER.size))
+
+                if not mheader.conversationIndex:
+                    if mheader.identifier > self.cur_message:
+                        self.cur_message = mheader.identifier
+
+                if mheader.fragmentCount > 1 and mheader.fragmentId == 0:
+                    # when reading multiple message fragments, the first fragment contains only a message header
+                    continue
+
+                key = (mheader.channelCode, mheader.identifier)
+                fragments.setdefault(key, []).append(await self.service.aio_recvall(mheader.length))
+                if mheader.fragmentId != mheader.fragmentCount - 1:
+                    continue
+
+                message = b''.join(fragments.pop(key))
+                reply = self.pending_replies.get(mheader.identifier) if mheader.conversationIndex else None
+                if reply is not None:
+                    if not reply.done():
+                        reply.set_result(message)
+                else:
+                    # treat both as the negative and positive representation of the channel code the same
+                    self._get_channel_queue(abs(mheader.channelCode)).put_nowait(message)
+        except asyncio.CancelledError:
+            # a subclass of Exception prior to python3.8
+            raise
+        except Exception as e:
+            # any failure ends the stream, so every waiter must be woken up instead of blocking forever
+            self._reader_exception = e
+            for queue in self.channel_queues.values():
+                queue.put_nowait(None)
+            for reply in self.pending_replies.values():
+                if not reply.done():
+                    error = ConnectionTerminatedError()
+                    error.__cause__ = e
+                    reply.set_exception(error)
 
     def __enter__(self):
         self.perform_handshake()
         return self
 
+    async def __aenter__(self):
+        self._reader_task = asyncio.ensure_future(self._reader_loop())
+        try:
+            await self.aio_perform_handshake()
+        except BaseException:
+            # __aexit__ isn't called when __aenter__ fails, so the reader and the connection must be closed here
+            await self.aio_close()
+            raise
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aio_close()
+
+    async def aio_close(self):
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+            try:
+                await self._reader_task
+            except asyncio.CancelledError:
+                pass
+            self._reader_task = None
+        try:
+            await self.service.aio_close()
+        except ConnectionError:
+            # the peer may have already reset the connection, which must not hide the error that got us here
+            pass
+
 
 class Tap:
     def __init__(self, dvt, channel_name: str, config: typing.Mapping):
@@ -372,10 +615,12 @@ class Tap:
         self._channel_name = channel_name
         self._channel = None
         self._config = config
+        self._set_config_selector = archive_selector('setConfig:')
+        self._set_config_aux = bytes(MessageAux().append_obj(config))
 
     def __enter__(self):
         self._channel = self._dvt.make_channel(self._channel_name)
-        self._channel.setConfig_(MessageAux().append_obj(self._config), expects_reply=False)
+        self._dvt.send_prebuilt(self._channel, self._set_config_selector, self._set_config_aux, expects_reply=False)
         self._channel.start(expects_reply=False)
 
         # first message is just kind of an ack
@@ -387,5 +632,5 @@ class Tap:
 
     def __iter__(self):
         while True:
-            for result in self._channel.receive_plist():
+            for result in self._dvt.recv_plist(self._channel, skip=TAP_HEARTBEAT_MESSAGE_CLASS)[0]:
                 yield result
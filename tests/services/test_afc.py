@@ -1,3 +1,4 @@
+import io
 import pathlib
 from datetime import datetime
 
@@ -337,3 +338,46 @@ def test_push_pull_bigger_than_max_chunk(afc: AfcService):
     afc.set_file_contents('test', contents)
     assert contents == afc.get_file_contents('test')
     afc.rm('test')
+
+
+def test_file_contents_iter(afc: AfcService):
+    chunks = [b'x' * MAXIMUM_READ_SIZE, b'y' * MAXIMUM_READ_SIZE, b'z']
+    afc.set_file_contents_iter(TEST_FILENAME, chunks)
+    try:
+        assert list(afc.get_file_contents_iter(TEST_FILENAME)) == chunks
+    finally:
+        afc.rm(TEST_FILENAME)
+
+
+def test_set_file_contents_from_file(afc: AfcService, tmp_path: pathlib.Path):
+    contents = bytes(range(256)) * 40 + b'tail'
+    local_file = tmp_path / TEST_FILENAME
+    local_file.write_bytes(contents)
+    try:
+        with open(local_file, 'rb') as f:
+            # several chunks, each sent using sendfile()
+            afc.set_file_contents_from_file(TEST_FILENAME, f, chunk_size=1000)
+        assert afc.get_file_contents(TEST_FILENAME) == contents
+    finally:
+        afc.rm(TEST_FILENAME)
+
+
+def test_set_file_contents_from_stream(afc: AfcService):
+    contents = bytes(range(256)) * 40 + b'tail'
+    try:
+        afc.set_file_contents_from_file(TEST_FILENAME, io.BytesIO(contents), chunk_size=1000)
+        assert afc.get_file_contents(TEST_FILENAME) == contents
+    finally:
+        afc.rm(TEST_FILENAME)
+
+
+def test_pull_dir_concurrently(afc: AfcService, tmp_path: pathlib.Path):
+    contents = {f'file{i}': f'data{i}'.encode() for i in range(10)}
+    afc.makedirs(TEST_FOLDER_NAME)
+    try:
+        for filename, data in contents.items():
+            afc.set_file_contents(f'{TEST_FOLDER_NAME}/{filename}', data)
+        afc.pull(TEST_FOLDER_NAME, str(tmp_path), jobs=4)
+    finally:
+        afc.rm(TEST_FOLDER_NAME)
+    assert {path.name: path.read_bytes() for path in (tmp_path / TEST_FOLDER_NAME).iterdir()} == contents
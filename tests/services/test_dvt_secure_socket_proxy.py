@@ -1,3 +1,4 @@
+import asyncio
 from pathlib import Path
 
 import pytest
@@ -66,6 +67,46 @@ def test_proclist(lockdown):
     assert not lockdownd['isApplication']
 
 
+def test_aio_proclist(lockdown):
+    """
+    Test listing processes over the asyncio API.
+    :param pymobiledevice3.lockdown.LockdownClient lockdown: Lockdown client.
+    """
+    async def proclist():
+        async with await DvtSecureSocketProxyService.aio_create(lockdown) as dvt:
+            channel = await dvt.aio_make_channel(DeviceInfo.IDENTIFIER)
+            await channel.aio_send_message('runningProcesses')
+            return await channel.aio_receive_plist()
+
+    # When deprecating python3.6, replace with asyncio.run.
+    loop = asyncio.new_event_loop()
+    try:
+        processes = loop.run_until_complete(proclist())
+    finally:
+        loop.close()
+    assert '/usr/libexec/lockdownd' in [process['realAppName'] for process in processes]
+
+
+def test_aio_execname_for_pids(lockdown):
+    """
+    Test pipelining several requests over the asyncio API.
+    :param pymobiledevice3.lockdown.LockdownClient lockdown: Lockdown client.
+    """
+    lockdownd = get_process_data(lockdown, 'lockdownd')
+
+    async def execnames():
+        async with await DvtSecureSocketProxyService.aio_create(lockdown) as dvt:
+            device_info = await DeviceInfo.aio_create(dvt)
+            return await device_info.aio_execname_for_pids([lockdownd['pid']] * 3)
+
+    # When deprecating python3.6, replace with asyncio.run.
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(execnames()) == ['/usr/libexec/lockdownd'] * 3
+    finally:
+        loop.close()
+
+
 def test_applist(lockdown):
     """
     Test listing applications.
@@ -0,0 +1,77 @@
+import asyncio
+import socket
+
+import pytest
+
+from pymobiledevice3.exceptions import ConnectionTerminatedError
+from pymobiledevice3.service_connection import ServiceConnection
+from pymobiledevice3.services.remote_server import RemoteServer, MessageAux, DTX_MESSAGE_MAGIC, DTX_MESSAGE_HEADER, \
+    DTX_MESSAGE_PAYLOAD_HEADER, archive_selector
+
+
+def build_message(data: bytes, aux: MessageAux = None, identifier: int = 1) -> bytes:
+    aux = bytes(aux) if aux is not None else b''
+    payload = DTX_MESSAGE_PAYLOAD_HEADER.pack(0, len(aux), len(aux) + len(data)) + aux + data
+    return DTX_MESSAGE_HEADER.pack(DTX_MESSAGE_MAGIC, DTX_MESSAGE_HEADER.size, 0, 1, len(payload), identifier, 0, 0,
+                                   0) + payload
+
+
+def handshake_reply(selector: str = RemoteServer.HANDSHAKE_SELECTOR) -> bytes:
+    return build_message(archive_selector(selector), MessageAux().append_obj({'com.apple.instruments.server': 1}))
+
+
+def run(coroutine):
+    # When deprecating python3.6, replace with asyncio.run.
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+@pytest.fixture(scope='function')
+def device():
+    """
+    Creates a connected socket pair, the first acting as the service connection and the second as the device.
+    """
+    service_socket, device_socket = socket.socketpair()
+    with device_socket:
+        yield service_socket, device_socket
+
+
+async def connect(service_socket) -> RemoteServer:
+    service = ServiceConnection(service_socket)
+    await service.aio_start()
+    return RemoteServer(None, 'test', remove_ssl_context=False, service=service)
+
+
+def test_aio_request_after_reader_failure(device):
+    service_socket, device_socket = device
+
+    async def request():
+        device_socket.sendall(handshake_reply())
+        async with await connect(service_socket) as dvt:
+            # an invalid message magic ends the reader
+            device_socket.sendall(b'\x00' * DTX_MESSAGE_HEADER.size)
+            with pytest.raises(ConnectionTerminatedError):
+                await asyncio.wait_for(dvt.aio_recv_plist(), 2)
+            with pytest.raises(ConnectionTerminatedError):
+                await asyncio.wait_for(dvt.aio_request(0, 'foo:'), 2)
+
+    run(request())
+
+
+def test_aio_failed_handshake_closes_connection(device):
+    service_socket, device_socket = device
+
+    async def handshake():
+        device_socket.sendall(handshake_reply('wrongSelector:'))
+        with pytest.raises(ValueError):
+            async with await connect(service_socket):
+                pass
+
+    run(handshake())
+    device_socket.settimeout(2)
+    # skip the handshake request until the connection is closed
+    while device_socket.recv(4096):
+        pass